@@ -1,11 +1,18 @@
 import traceback
 import os
+import gzip
+import hashlib
+import hmac
+import json
+import secrets
+import zlib
+import click
 from flask import Flask, request, jsonify, session, render_template, redirect, url_for, cli
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from flask_migrate import Migrate
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 app = Flask(__name__)
 
@@ -65,10 +72,52 @@ class SOSMessage(db.Model):
     mobile_number = db.Column(db.String(20), nullable=True)
     disaster_type = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Store-and-forward sync: where the report was first recorded and its
+    # sequence number on that node. Central submissions have no origin_seq.
+    origin_node = db.Column(db.String(64), nullable=False, default='central', server_default='central')
+    origin_seq = db.Column(db.Integer, nullable=True)
+    status_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('origin_node', 'origin_seq', name='uq_sos_message_origin'),
+    )
 
     def __repr__(self):
         return f'<SOSMessage {self.id} - {self.name} - {self.status}>'
 
+class SOSChange(db.Model):
+    """Central change log of status updates; seq is the cursor nodes pull from."""
+    id = db.Column(db.Integer, primary_key=True)
+    # Assigned from SyncCounter under a row lock so seqs become visible in commit order.
+    seq = db.Column(db.Integer, nullable=False, unique=True)
+    sos_id = db.Column(db.Integer, db.ForeignKey('sos_message.id'), nullable=False, index=True)
+    origin_node = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sos = db.relationship('SOSMessage')
+
+    def __repr__(self):
+        return f'<SOSChange {self.seq} - SOS {self.sos_id} - {self.status}>'
+
+class SyncCounter(db.Model):
+    """Named monotonic counters; the row is locked while a value is handed out."""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SyncCounter {self.name} - {self.value}>'
+
+class SyncNode(db.Model):
+    """A registered edge node: its token hash and sync cursors (contiguous pushed seq, last pulled change)."""
+    node_id = db.Column(db.String(64), primary_key=True)
+    token_hash = db.Column(db.String(64), nullable=False)
+    last_pushed_seq = db.Column(db.Integer, nullable=False, default=0)
+    last_pulled_seq = db.Column(db.Integer, nullable=False, default=0)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SyncNode {self.node_id} - push {self.last_pushed_seq} - pull {self.last_pulled_seq}>'
+
 class Announcement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -90,6 +139,157 @@ def is_admin():
     """Checks if the current session user is the admin."""
     return 'user' in session and session.get('user') == ADMIN_USERNAME
 
+ALLOWED_STATUSES = ['Pending', 'Under Review', 'Resolved', 'False Alarm']
+CENTRAL_NODE_ID = 'central'
+SOS_CHANGE_COUNTER = 'sos_change'
+SYNC_MAX_PUSH_CHANGES = 5000
+SYNC_DEFAULT_PULL_LIMIT = 500
+SYNC_MAX_PULL_LIMIT = 5000
+SYNC_MAX_BODY_BYTES = 16 * 1024 * 1024
+SYNC_MAX_SEQ = 2**31 - 1
+
+class SyncPayloadTooLarge(Exception):
+    """Raised when a sync request body exceeds SYNC_MAX_BODY_BYTES (before or after inflating)."""
+
+def next_change_seq():
+    """Returns the next SOSChange seq, holding a row lock on the counter until the transaction ends."""
+    counter = (db.session.query(SyncCounter)
+               .filter_by(name=SOS_CHANGE_COUNTER)
+               .with_for_update()
+               .one_or_none())
+    if counter is None:
+        counter = SyncCounter(name=SOS_CHANGE_COUNTER, value=0)
+        db.session.add(counter)
+    counter.value += 1
+    return counter.value
+
+def record_status_change(sos, new_status, origin_node, changed_at):
+    """Sets the status of an SOS message and appends the change to the sync log."""
+    sos.status = new_status
+    sos.status_updated_at = changed_at
+    db.session.add(SOSChange(seq=next_change_seq(), sos=sos, origin_node=origin_node,
+                             status=new_status, changed_at=changed_at))
+
+def parse_sync_timestamp(value):
+    """Parses an ISO 8601 timestamp into a naive UTC datetime, or returns None."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def is_sync_seq(value):
+    """Checks that a value is a positive integer that fits the Integer seq columns."""
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value <= SYNC_MAX_SEQ
+
+def read_sync_payload():
+    """Returns the JSON body of a sync request, gunzipping it (size-capped) if Content-Encoding is gzip."""
+    if request.content_length is not None and request.content_length > SYNC_MAX_BODY_BYTES:
+        raise SyncPayloadTooLarge()
+    raw = request.get_data()
+    if len(raw) > SYNC_MAX_BODY_BYTES:
+        raise SyncPayloadTooLarge()
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        raw = inflater.decompress(raw, SYNC_MAX_BODY_BYTES + 1)
+        if len(raw) > SYNC_MAX_BODY_BYTES or inflater.unconsumed_tail:
+            raise SyncPayloadTooLarge()
+        if not inflater.eof:
+            raise ValueError("Truncated gzip stream")
+    return json.loads(raw.decode('utf-8'))
+
+def sync_response(payload, status_code=200):
+    """Builds a JSON response, gzip-compressed when the client accepts it."""
+    response = jsonify(payload)
+    response.status_code = status_code
+    response.headers['Vary'] = 'Accept-Encoding'
+    if request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(response.get_data()))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def hash_node_token(token):
+    """Returns the hex SHA-256 of a node token (tokens are random, so no slow hash is needed)."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def get_sync_node(node_id, token, for_update=False):
+    """Returns the registered SyncNode for node_id if token matches, otherwise None.
+
+    With for_update the row stays locked until commit, serializing concurrent pushes from one node.
+    """
+    if not isinstance(node_id, str) or not node_id.strip() or not token:
+        return None
+    node = db.session.get(SyncNode, node_id.strip(), with_for_update=for_update or None)
+    if node is None or not hmac.compare_digest(node.token_hash, hash_node_token(token)):
+        return None
+    node.last_seen_at = datetime.utcnow()
+    return node
+
+def clean_sync_create(sos_data):
+    """Validates the sos object of a pushed create change; returns (fields, None) or (None, error)."""
+    if not isinstance(sos_data, dict):
+        return None, 'create requires an sos object'
+    fields = {}
+    for field in ('location', 'message', 'name', 'source', 'mobile_number', 'disaster_type'):
+        value = sos_data.get(field)
+        if value is None:
+            fields[field] = None
+            continue
+        if not isinstance(value, str):
+            return None, f'sos.{field} must be a string'
+        value = value.strip()
+        max_length = SOSMessage.__table__.c[field].type.length
+        if max_length is not None and len(value) > max_length:
+            return None, f'sos.{field} must be at most {max_length} characters'
+        fields[field] = value or None
+    if not fields['location'] or not fields['message']:
+        return None, 'create requires non-empty sos.location and sos.message'
+    status = sos_data.get('status')
+    if status is not None and status not in ALLOWED_STATUSES:
+        return None, f'sos.status must be one of: {", ".join(ALLOWED_STATUSES)}'
+    fields['status'] = status or 'Pending'
+    fields['source'] = fields['source'] or 'edge_node'
+    fields['created_at'] = parse_sync_timestamp(sos_data.get('created_at')) or datetime.utcnow()
+    # Without a node timestamp the status stays unstamped (oldest under LWW), so the
+    # node's own offline status changes pushed after the create still apply.
+    fields['status_updated_at'] = parse_sync_timestamp(sos_data.get('status_updated_at'))
+    return fields, None
+
+def find_sync_ref(ref, node_id):
+    """Resolves the ref of a pushed status change to a row-locked SOSMessage; returns (sos, error)."""
+    if not isinstance(ref, dict):
+        return None, 'status change requires a ref object'
+    if ref.get('id') is not None:
+        if not is_sync_seq(ref['id']):
+            return None, 'ref.id must be a positive integer'
+        sos = db.session.get(SOSMessage, ref['id'], with_for_update=True, populate_existing=True)
+    else:
+        origin_node = ref.get('origin_node') or node_id
+        if not isinstance(origin_node, str) or len(origin_node) > 64:
+            return None, 'ref.origin_node must be a string of at most 64 characters'
+        if not is_sync_seq(ref.get('origin_seq')):
+            return None, 'ref requires an integer id or origin_seq'
+        sos = (SOSMessage.query
+               .filter_by(origin_node=origin_node, origin_seq=ref['origin_seq'])
+               .populate_existing()
+               .with_for_update()
+               .first())
+    if sos is None:
+        return None, 'Referenced SOS message not found'
+    return sos, None
+
+def serialize_sos_for_sync(sos):
+    """Returns the sync identity and status fields of an SOS message."""
+    return {
+        "id": sos.id, "origin_node": sos.origin_node, "origin_seq": sos.origin_seq,
+        "status": sos.status,
+        "status_updated_at": sos.status_updated_at.isoformat() if sos.status_updated_at else None
+    }
+
 # --- Routes ---
 # NO CHANGES NEEDED IN ROUTE LOGIC, assuming correct ORM usage
 
@@ -328,6 +528,182 @@ def api_submit_sos_flexible():
         }), 500
 
 
+# --- Edge Node Sync (Store-and-Forward) ---
+# Field nodes are registered with `flask register-node <node_id>` and authenticate
+# with the X-Node-Token header. They push their local change log in batches keyed
+# by (node_id, seq) and pull back central status changes for the reports they
+# originated. Bodies may be gzip-compressed in both directions. Status conflicts
+# resolve last-writer-wins on the change timestamp.
+
+@app.route('/api/v1/sync/push', methods=['POST'])
+def sync_push():
+    try:
+        data = read_sync_payload()
+    except SyncPayloadTooLarge:
+        return sync_response({"error": f"Request body exceeds {SYNC_MAX_BODY_BYTES} bytes"}, 413)
+    except (OSError, EOFError, zlib.error, UnicodeDecodeError, ValueError, RecursionError):
+        return sync_response({"error": "Request body must be JSON, optionally gzip-compressed"}, 400)
+    if not isinstance(data, dict):
+        return sync_response({"error": "Request body must be a JSON object"}, 400)
+
+    changes = data.get('changes')
+    if not isinstance(changes, list):
+        return sync_response({"error": "changes must be a list"}, 400)
+    if len(changes) > SYNC_MAX_PUSH_CHANGES:
+        return sync_response({"error": f"Too many changes in one batch (max {SYNC_MAX_PUSH_CHANGES})"}, 413)
+
+    # Structural problems reject the whole batch; errors are keyed by list index.
+    errors = {}
+    seen_seqs = set()
+    for index, change in enumerate(changes):
+        seq = change.get('seq') if isinstance(change, dict) else None
+        if not is_sync_seq(seq):
+            errors[str(index)] = f'Each change must be an object with an integer seq between 1 and {SYNC_MAX_SEQ}'
+        elif seq in seen_seqs:
+            errors[str(index)] = f'Duplicate seq {seq} in batch'
+        elif change.get('type') not in ('create', 'status'):
+            errors[str(index)] = 'type must be "create" or "status"'
+        else:
+            seen_seqs.add(seq)
+    if errors:
+        return sync_response({"error": "Validation failed", "details": errors}, 400)
+
+    try:
+        node = get_sync_node(data.get('node_id'), request.headers.get('X-Node-Token'), for_update=True)
+        if node is None:
+            return sync_response({"error": "Unknown node_id or invalid X-Node-Token"}, 401)
+
+        # The ack only advances through seqs contiguous with last_pushed_seq, so a gap
+        # (a change lost or still in flight) holds back everything after it. Changes at
+        # or below the ack were ingested by an earlier push and are reported as stale.
+        ordered = sorted(changes, key=lambda c: c['seq'])
+        stale = [c['seq'] for c in ordered if c['seq'] <= node.last_pushed_seq]
+        contiguous = []
+        expected = node.last_pushed_seq + 1
+        for change in ordered:
+            if change['seq'] < expected:
+                continue
+            if change['seq'] != expected:
+                break
+            contiguous.append(change)
+            expected += 1
+        deferred = len(ordered) - len(stale) - len(contiguous)
+
+        # Per-change rejections are keyed by seq. They are still acknowledged, since
+        # retrying them cannot succeed, and reported so the node can surface them.
+        rejected = {}
+        created = {}
+        applied = 0
+        skipped = 0
+        for change in contiguous:
+            seq = change['seq']
+            if change['type'] == 'create':
+                fields, error = clean_sync_create(change.get('sos'))
+                if error:
+                    rejected[str(seq)] = error
+                    continue
+                existing = SOSMessage.query.filter_by(origin_node=node.node_id, origin_seq=seq).first()
+                if existing:
+                    created[str(seq)] = existing.id
+                    skipped += 1
+                    continue
+                new_sos = SOSMessage(origin_node=node.node_id, origin_seq=seq, **fields)
+                db.session.add(new_sos)
+                db.session.flush()
+                created[str(seq)] = new_sos.id
+                applied += 1
+            else:
+                new_status = change.get('status')
+                changed_at = parse_sync_timestamp(change.get('changed_at'))
+                if new_status not in ALLOWED_STATUSES or changed_at is None:
+                    rejected[str(seq)] = 'status change requires a valid status and ISO 8601 changed_at'
+                    continue
+                sos, error = find_sync_ref(change.get('ref'), node.node_id)
+                if error:
+                    rejected[str(seq)] = error
+                    continue
+                if sos.status_updated_at and changed_at <= sos.status_updated_at:
+                    skipped += 1
+                    continue
+                record_status_change(sos, new_status, node.node_id, changed_at)
+                applied += 1
+
+        node.last_pushed_seq = expected - 1
+        db.session.commit()
+        print(f"Sync push from node {node.node_id}: {applied} applied, {skipped} skipped, {len(stale)} stale, {deferred} deferred, {len(rejected)} rejected, acked seq {node.last_pushed_seq}")
+        return sync_response({
+            "status": "success",
+            "node_id": node.node_id,
+            "acked_seq": node.last_pushed_seq,
+            "applied": applied,
+            "skipped": skipped,
+            "stale": stale,
+            "deferred": deferred,
+            "created": created,
+            "rejected": rejected
+        })
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error processing sync push: {str(e)}")
+        print(traceback.format_exc())
+        return sync_response({"error": "Internal server error during sync push", "details": str(e)}, 500)
+
+@app.route('/api/v1/sync/pull')
+def sync_pull():
+    try:
+        since = request.args.get('since', type=int)
+        limit = int(request.args.get('limit', SYNC_DEFAULT_PULL_LIMIT))
+    except ValueError:
+        return sync_response({"error": "since and limit must be integers"}, 400)
+    if 'since' in request.args and since is None:
+        return sync_response({"error": "since and limit must be integers"}, 400)
+    if (since is not None and since < 0) or limit <= 0:
+        return sync_response({"error": "since must be >= 0 and limit must be positive"}, 400)
+    limit = min(limit, SYNC_MAX_PULL_LIMIT)
+
+    try:
+        node = get_sync_node(request.args.get('node_id'), request.headers.get('X-Node-Token'))
+        if node is None:
+            return sync_response({"error": "Unknown node_id or invalid X-Node-Token"}, 401)
+        # Requesting changes after `since` acknowledges everything up to it; without
+        # `since`, resume from the last acknowledged change.
+        if since is None:
+            since = node.last_pulled_seq
+        node.last_pulled_seq = max(node.last_pulled_seq, since)
+
+        # SOSChange.seq is handed out under a lock held until commit, so a committed
+        # seq is never followed by an earlier one committing later.
+        rows = (db.session.query(SOSChange, SOSMessage)
+                .join(SOSMessage, SOSChange.sos_id == SOSMessage.id)
+                .filter(SOSChange.seq > since,
+                        SOSMessage.origin_node == node.node_id,
+                        SOSChange.origin_node != node.node_id)
+                .order_by(SOSChange.seq)
+                .limit(limit + 1)
+                .all())
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        output = [{
+            "change_seq": change.seq,
+            "status": change.status,
+            "changed_at": change.changed_at.isoformat() if change.changed_at else None,
+            "sos": serialize_sos_for_sync(sos)
+            } for change, sos in rows]
+        next_since = rows[-1][0].seq if rows else since
+        db.session.commit()
+        return sync_response({
+            "node_id": node.node_id,
+            "changes": output,
+            "next_since": next_since,
+            "has_more": has_more
+        })
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error processing sync pull: {str(e)}")
+        print(traceback.format_exc())
+        return sync_response({"error": "Internal server error during sync pull", "details": str(e)}, 500)
+
+
 # --- Admin Data Retrieval & Management ---
 @app.route('/get_sos_messages')
 def get_sos_messages():
@@ -360,15 +736,19 @@ def update_status(sos_id):
     if not new_status:
         return jsonify({'message': 'Missing status field in request body'}), 400
 
-    allowed_statuses = ['Pending', 'Under Review', 'Resolved', 'False Alarm']
-    if new_status not in allowed_statuses:
-        return jsonify({'message': f'Invalid status: "{new_status}". Allowed statuses are: {", ".join(allowed_statuses)}'}), 400
+    if new_status not in ALLOWED_STATUSES:
+        return jsonify({'message': f'Invalid status: "{new_status}". Allowed statuses are: {", ".join(ALLOWED_STATUSES)}'}), 400
 
     try:
-        # Use db.session.get() for primary key lookup (more efficient)
-        sos = db.session.get(SOSMessage, sos_id)
+        # Lock the row so the timestamp comparison below cannot race a sync push.
+        sos = db.session.get(SOSMessage, sos_id, with_for_update=True)
         if sos:
-            sos.status = new_status
+            # The central edit is the latest write: keep its timestamp ahead of any
+            # (possibly clock-skewed) edge timestamp so nodes accept it under LWW.
+            changed_at = datetime.utcnow()
+            if sos.status_updated_at and changed_at <= sos.status_updated_at:
+                changed_at = sos.status_updated_at + timedelta(milliseconds=1)
+            record_status_change(sos, new_status, CENTRAL_NODE_ID, changed_at)
             db.session.commit()
             print(f"Updated status for SOS ID {sos_id} to {new_status}")
             return jsonify({'message': 'Status updated successfully', 'id': sos_id, 'new_status': new_status})
@@ -495,6 +875,30 @@ def init_db_command():
         cli.abort(1)
 
 
+@app.cli.command('register-node')
+@click.argument('node_id')
+def register_node_command(node_id):
+    """Registers an edge node for sync (or rotates its token) and prints the token."""
+    node_id = node_id.strip()
+    if not node_id or len(node_id) > 64 or node_id == CENTRAL_NODE_ID:
+        print(f"ERROR: node_id must be 1-64 characters and not '{CENTRAL_NODE_ID}'.")
+        raise click.Abort()
+    token = secrets.token_urlsafe(32)
+    try:
+        node = db.session.get(SyncNode, node_id)
+        if node is None:
+            node = SyncNode(node_id=node_id, last_pushed_seq=0, last_pulled_seq=0)
+            db.session.add(node)
+        node.token_hash = hash_node_token(token)
+        db.session.commit()
+        print(f"Node {node_id} registered. Configure it with X-Node-Token: {token}")
+    except Exception as e:
+        db.session.rollback()
+        print(f"ERROR registering node {node_id}: {e}")
+        print(traceback.format_exc())
+        raise click.Abort()
+
+
 # --- App Initialization & Run (for Local Development) ---
 # This block is ignored by production WSGI servers like Gunicorn (used by Render)
 if __name__ == '__main__':
@@ -0,0 +1,68 @@
+"""Add edge node store-and-forward sync
+
+Revision ID: 5c3e9a7d21b4
+Revises: 0bbe368f1d02
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c3e9a7d21b4'
+down_revision = '0bbe368f1d02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sos_message', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('origin_node', sa.String(length=64), server_default='central', nullable=False))
+        batch_op.add_column(sa.Column('origin_seq', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('status_updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_unique_constraint('uq_sos_message_origin', ['origin_node', 'origin_seq'])
+
+    op.create_table('sos_change',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('sos_id', sa.Integer(), nullable=False),
+    sa.Column('origin_node', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['sos_id'], ['sos_message.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('seq')
+    )
+    with op.batch_alter_table('sos_change', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sos_change_sos_id'), ['sos_id'], unique=False)
+
+    op.create_table('sync_node',
+    sa.Column('node_id', sa.String(length=64), nullable=False),
+    sa.Column('token_hash', sa.String(length=64), nullable=False),
+    sa.Column('last_pushed_seq', sa.Integer(), nullable=False),
+    sa.Column('last_pulled_seq', sa.Integer(), nullable=False),
+    sa.Column('last_seen_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('node_id')
+    )
+
+    sync_counter = op.create_table('sync_counter',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(sync_counter, [{'name': 'sos_change', 'value': 0}])
+
+
+def downgrade():
+    op.drop_table('sync_counter')
+    op.drop_table('sync_node')
+    with op.batch_alter_table('sos_change', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sos_change_sos_id'))
+
+    op.drop_table('sos_change')
+    with op.batch_alter_table('sos_message', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_sos_message_origin', type_='unique')
+        batch_op.drop_column('status_updated_at')
+        batch_op.drop_column('origin_seq')
+        batch_op.drop_column('origin_node')